@@ -1,6 +1,30 @@
 import streamlit as st
 import pandas as pd
-import re
+import numpy as np
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+# The polars path needs fastexcel (calamine) and pyarrow (to_pandas) as well
+try:
+    import polars as pl
+    import fastexcel  # noqa: F401
+    import pyarrow  # noqa: F401
+except ImportError:
+    pl = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    STRING_DTYPE = "string[pyarrow]"
+except ImportError:
+    pa = None
+    STRING_DTYPE = "string"
+
+try:
+    import xlsxwriter  # noqa: F401
+    EXCEL_ENGINE = "xlsxwriter"
+except ImportError:
+    EXCEL_ENGINE = None  # pandas default (openpyxl)
 
 st.set_page_config(page_title="PRO GST Excel Reconciliation", layout="wide")
 
@@ -22,141 +46,314 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # ======================================
-# GSTIN VALIDATION FUNCTION
+# GSTIN VALIDATION PATTERN
 # ======================================
-def valid_gstin(gstin):
-    pattern = r'^[0-9]{2}[A-Z]{5}[0-9]{4}[A-Z]{1}[1-9A-Z]{1}Z[0-9A-Z]{1}$'
-    return bool(re.match(pattern, str(gstin)))
+# Matched column-wise via Series.str.match
+GSTIN_PATTERN = r'^[0-9]{2}[A-Z]{5}[0-9]{4}[A-Z]{1}[1-9A-Z]{1}Z[0-9A-Z]{1}$'
+
+# Fixed order for the Status category
+STATUSES = ["Matched", "Mismatch", "Missing in 2B", "Invalid GSTIN"]
+
+# st.cache_data is process-wide, so every cache is bounded and expires
+CACHE_TTL = "1h"
 
 # ======================================
-# FILE UPLOADS
+# EXCEL READER (polars + calamine, pandas fallback)
 # ======================================
-purchase_file = st.file_uploader("Upload Purchase Register Excel", type=["xlsx"])
-b2b_file = st.file_uploader("Upload GSTR-2B Excel", type=["xlsx"])
+RENAME_MAP = {
+    "GSTIN": "GSTIN",
+    "Invoice Number": "Invoice_Number",
+    "Invoice No": "Invoice_Number",
+    "Invoice Date": "Invoice_Date",
+    "Invoice_Date": "Invoice_Date",
+    "CGST": "CGST",
+    "SGST": "SGST",
+    "IGST": "IGST"
+}
 
-if purchase_file and b2b_file:
+# Only these headers are parsed, every other column is skipped
+SOURCE_COLUMNS = set(RENAME_MAP) | set(RENAME_MAP.values())
+
+def read_excel(file):
+    if pl is not None:
+        # Infer column types from every row: with the default 100-row sample
+        # a later value that doesn't fit (e.g. "INV-250" in a numeric invoice
+        # column) is silently read as null
+        return pl.read_excel(
+            file,
+            engine="calamine",
+            infer_schema_length=None,
+            read_options={"use_columns": lambda col: col.name.strip() in SOURCE_COLUMNS}
+        ).to_pandas(use_pyarrow_extension_array=True)
+    return pd.read_excel(file, usecols=lambda c: str(c).strip() in SOURCE_COLUMNS)
+
+# ======================================
+# INVOICE DATE PARSER (explicit formats before inference)
+# ======================================
+DATE_FORMATS = ["%d-%m-%Y", "%Y-%m-%d"]
+
+def parse_invoice_date(s):
+    if isinstance(s.dtype, np.dtype) and s.dtype.kind == "M":
+        return s
+
+    # Arrow date/timestamp columns (real Excel date cells via calamine) are
+    # converted to NumPy datetime64 so later comparisons with Timestamp work
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return pd.to_datetime(s)
+
+    parsed = pd.to_datetime(s, format=DATE_FORMATS[0], errors="coerce", cache=True)
+
+    # Retry only the values the previous format could not read
+    for fmt in DATE_FORMATS[1:] + [None]:
+        todo = parsed.isna() & s.notna()
+        if not todo.any():
+            break
+        parsed[todo] = pd.to_datetime(s[todo], format=fmt, errors="coerce", cache=True)
+
+    return parsed
+
+# ======================================
+# MATCH KEY STRINGS
+# ======================================
+def to_key_strings(s):
+    # Whole-number floats (an invoice column with blanks) are keyed as
+    # integers so 123.0 and 123 match across files
+    # (checked on a NumPy view: Arrow-backed floats have no % operator)
+    if pd.api.types.is_float_dtype(s):
+        values = s.to_numpy(dtype="float64", na_value=np.nan)
+        if (np.isnan(values) | (values % 1 == 0)).all():
+            s = pd.Series(values, index=s.index).astype("Int64")
+
+    # Numbers are cast by pyarrow in C rather than one str() call per value
+    if pa is not None and pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s):
+        return pd.Series(
+            pd.arrays.ArrowStringArray(pc.cast(pa.array(s), pa.string())),
+            index=s.index
+        )
+
+    return s.astype(STRING_DTYPE)
+
+# ======================================
+# MATCHING ENGINE
+# ======================================
+# Both engines return (tax_diff, code) aligned with purchase_df rows.
+# code indexes STATUSES: 3 Invalid GSTIN > 2 Missing in 2B > 1 Mismatch > 0 Matched
+# A key with a blank GSTIN or Invoice_Number never matches: such purchase
+# rows are "Missing in 2B", and such 2B rows are left out of the join (and
+# so out of the duplicate check).
+MATCH_KEYS = ["GSTIN", "Invoice_Number"]
+TAX_COLS = ["CGST", "SGST", "IGST"]
+
+def match_lazy(purchase_df, b2b_df):
+    # Join, tax difference and status code run as one optimised polars plan
+    # Tax amounts are compared as whole paise (Int64), not floats
+    to_paise = [(pl.col(c) * 100).round(0).cast(pl.Int64) for c in TAX_COLS]
+
+    lf_p = pl.from_pandas(purchase_df[MATCH_KEYS + TAX_COLS + ["GSTIN_Valid"]]).lazy()
+    lf_b = pl.from_pandas(b2b_df[MATCH_KEYS + TAX_COLS]).lazy()
+
+    lf_p = lf_p.with_columns(to_paise)
+    lf_b = lf_b.with_columns(to_paise).drop_nulls(MATCH_KEYS)
+
+    plan = (
+        lf_p.with_row_index("_row")
+        .join(lf_b, on=MATCH_KEYS, how="left", suffix="_2B", validate="m:1")
+        .with_columns(
+            Tax_Diff=pl.sum_horizontal(
+                [(pl.col(c) - pl.col(f"{c}_2B")).abs().fill_null(0) for c in TAX_COLS]
+            )
+        )
+        .with_columns(
+            code=pl.when(~pl.col("GSTIN_Valid")).then(3)
+            .when(pl.col("CGST_2B").is_null()).then(2)
+            .when(pl.col("Tax_Diff") != 0).then(1)
+            .otherwise(0)
+        )
+        .sort("_row")
+        .select(pl.col("Tax_Diff") / 100, "code")
+    )
+
+    try:
+        out = plan.collect()
+    except pl.exceptions.ComputeError as e:
+        # Only the m:1 join validation failure means duplicate 2B keys;
+        # any other compute error is a real failure and propagates
+        if "m:1" not in str(e):
+            raise
+        raise pd.errors.MergeError(str(e)) from e
+
+    return out["Tax_Diff"].to_numpy(), out["code"].to_numpy()
+
+def match_eager(purchase_df, b2b_df):
+    b2b_df = b2b_df.dropna(subset=MATCH_KEYS)
+
+    # Factorize the key columns over both sides into one int64 surrogate
+    # key, so the join hashes integers instead of string pairs. Blanks get
+    # their own code, but only purchase rows can still carry one, so a
+    # blank key never finds a 2B row
+    n = len(purchase_df)
+    key = np.zeros(n + len(b2b_df), dtype=np.int64)
+    for col in MATCH_KEYS:
+        codes, uniques = pd.factorize(
+            pd.concat([purchase_df[col], b2b_df[col]], ignore_index=True),
+            use_na_sentinel=False
+        )
+        key = key * len(uniques) + codes
+
+    b2b_indexed = b2b_df[TAX_COLS].set_axis(key[n:])
+
+    merged_df = purchase_df[TAX_COLS + ["GSTIN_Valid"]].assign(_k=key[:n]).join(
+        b2b_indexed,
+        on="_k",
+        rsuffix="_2B",
+        validate="m:1"
+    )
+
+    valid = merged_df["GSTIN_Valid"].to_numpy(dtype=bool)
+    missing = merged_df["CGST_2B"].isna().to_numpy()
+
+    # One subtract / abs / row-sum over the 3 tax columns, in whole paise
+    # (int64) so the comparison is exact; missing 2B rows count as no difference
+    p = merged_df[TAX_COLS].to_numpy(dtype="float64", na_value=np.nan)
+    b = merged_df[[f"{c}_2B" for c in TAX_COLS]].to_numpy(dtype="float64", na_value=np.nan)
+    p = np.rint(p * 100).astype(np.int64)
+    b = np.rint(np.nan_to_num(b) * 100).astype(np.int64)
+
+    diff_paise = np.abs(p - b).sum(axis=1)
+    diff_paise[missing] = 0
+
+    code = np.where(~valid, 3, np.where(missing, 2, np.where(diff_paise != 0, 1, 0)))
+
+    return diff_paise / 100, code
+
+# ======================================
+# RECONCILIATION PIPELINE (cached on the uploaded bytes)
+# ======================================
+@st.cache_data(show_spinner=False, max_entries=8, ttl=CACHE_TTL)
+def reconcile(purchase_bytes: bytes, b2b_bytes: bytes) -> pd.DataFrame:
+    # ======================================
+    # READ BOTH FILES (parsed concurrently)
+    # ======================================
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        fut_p = ex.submit(read_excel, io.BytesIO(purchase_bytes))
+        fut_b = ex.submit(read_excel, io.BytesIO(b2b_bytes))
+        purchase_df, b2b_df = fut_p.result(), fut_b.result()
 
     # ======================================
-    # READ PURCHASE REGISTER
+    # PURCHASE REGISTER
     # ======================================
-    purchase_df = pd.read_excel(purchase_file)
     purchase_df.columns = purchase_df.columns.str.strip()
 
-    purchase_df = purchase_df.rename(columns={
-        "GSTIN": "GSTIN",
-        "Invoice Number": "Invoice_Number",
-        "Invoice No": "Invoice_Number",
-        "Invoice Date": "Invoice_Date",
-        "Invoice_Date": "Invoice_Date",
-        "CGST": "CGST",
-        "SGST": "SGST",
-        "IGST": "IGST"
-    })
+    purchase_df = purchase_df.rename(columns=RENAME_MAP)
 
     if "Invoice_Date" in purchase_df.columns:
-        purchase_df["Invoice_Date"] = pd.to_datetime(
-            purchase_df["Invoice_Date"], errors='coerce'
-        )
+        purchase_df["Invoice_Date"] = parse_invoice_date(purchase_df["Invoice_Date"])
     else:
-        st.error("❌ Invoice Date column not found in Purchase Excel")
-        st.stop()
+        raise ValueError("Invoice Date column not found in Purchase Excel")
 
     # ======================================
-    # READ GSTR-2B EXCEL
+    # GSTR-2B EXCEL
     # ======================================
-    b2b_df = pd.read_excel(b2b_file)
     b2b_df.columns = b2b_df.columns.str.strip()
 
-    b2b_df = b2b_df.rename(columns={
-        "GSTIN": "GSTIN",
-        "Invoice Number": "Invoice_Number",
-        "Invoice No": "Invoice_Number",
-        "Invoice Date": "Invoice_Date",
-        "Invoice_Date": "Invoice_Date",
-        "CGST": "CGST",
-        "SGST": "SGST",
-        "IGST": "IGST"
-    })
+    b2b_df = b2b_df.rename(columns=RENAME_MAP)
 
     if "Invoice_Date" in b2b_df.columns:
-        b2b_df["Invoice_Date"] = pd.to_datetime(
-            b2b_df["Invoice_Date"], errors='coerce'
-        )
+        b2b_df["Invoice_Date"] = parse_invoice_date(b2b_df["Invoice_Date"])
     else:
-        st.error("❌ Invoice Date column not found in GSTR-2B Excel")
-        st.stop()
+        raise ValueError("Invoice Date column not found in GSTR-2B Excel")
 
     # ======================================
-    # FILL EMPTY TAX VALUES
+    # MATCH KEYS (Arrow-backed strings on both sides)
     # ======================================
-    for col in ["CGST", "SGST", "IGST"]:
-        purchase_df[col] = purchase_df[col].fillna(0)
-        b2b_df[col] = b2b_df[col].fillna(0)
+    # Text copies used for matching only; the original columns are kept
+    # for display and export
+    purchase_keys = {col: to_key_strings(purchase_df[col]) for col in MATCH_KEYS}
+    b2b_keys = {col: to_key_strings(b2b_df[col]) for col in MATCH_KEYS}
 
     # ======================================
-    # GSTIN VALIDATION
+    # FILL EMPTY TAX VALUES
     # ======================================
-    purchase_df["GSTIN_Valid"] = purchase_df["GSTIN"].apply(valid_gstin)
+    for df in (purchase_df, b2b_df):
+        df[TAX_COLS] = np.nan_to_num(
+            df[TAX_COLS].to_numpy(dtype="float64", na_value=np.nan), nan=0.0
+        )
 
     # ======================================
-    # CREATE UNIQUE KEY
+    # GSTIN VALIDATION
     # ======================================
-    purchase_df["KEY"] = (
-        purchase_df["GSTIN"].astype(str) + "_" +
-        purchase_df["Invoice_Number"].astype(str)
-    )
-
-    b2b_df["KEY"] = (
-        b2b_df["GSTIN"].astype(str) + "_" +
-        b2b_df["Invoice_Number"].astype(str)
+    purchase_df["GSTIN_Valid"] = (
+        purchase_keys["GSTIN"].str.match(GSTIN_PATTERN, na=False)
     )
 
-    # FAST LOOKUP DICTIONARY
-    b2b_dict = b2b_df.set_index("KEY").to_dict("index")
-
     # ======================================
-    # MATCHING ENGINE
+    # MATCHING ENGINE (VECTORISED)
     # ======================================
-    results = []
+    match = match_lazy if pl is not None else match_eager
 
-    for i, row in purchase_df.iterrows():
+    try:
+        tax_diff, code = match(
+            purchase_df.assign(**purchase_keys), b2b_df.assign(**b2b_keys)
+        )
+    except pd.errors.MergeError:
+        raise ValueError(
+            "Duplicate GSTIN + Invoice Number rows found in GSTR-2B Excel"
+        ) from None
 
-        key = row["KEY"]
-        status = "Matched"
-        remark = ""
+    purchase_df["Status"] = pd.Categorical.from_codes(code, categories=STATUSES)
 
-        if not row["GSTIN_Valid"]:
-            status = "Invalid GSTIN"
+    remark = np.take(
+        np.array(["", "", "Invoice not available in GSTR-2B", ""], dtype=object), code
+    )
+    mismatch = code == 1
+    remark[mismatch] = "Tax Difference = " + tax_diff[mismatch].astype(str).astype(object)
+    purchase_df["Remark"] = remark
+
+    result_df = purchase_df[[
+        "GSTIN", "Invoice_Number", "Invoice_Date",
+        "CGST", "SGST", "IGST", "Status", "Remark"
+    ]].rename(columns={
+        "Invoice_Number": "Invoice Number",
+        "Invoice_Date": "Invoice Date"
+    })
 
-        elif key not in b2b_dict:
-            status = "Missing in 2B"
-            remark = "Invoice not available in GSTR-2B"
+    result_df["GSTIN"] = result_df["GSTIN"].astype("category")
 
-        else:
-            b2b_row = b2b_dict[key]
+    return result_df
 
-            tax_diff = (
-                abs(row["CGST"] - b2b_row["CGST"]) +
-                abs(row["SGST"] - b2b_row["SGST"]) +
-                abs(row["IGST"] - b2b_row["IGST"])
-            )
+# ======================================
+# VENDOR SUMMARY (cached per result frame)
+# ======================================
+@st.cache_data(show_spinner=False, max_entries=32, ttl=CACHE_TTL)
+def vendor_summary(df: pd.DataFrame) -> pd.DataFrame:
+    return (
+        df.groupby("GSTIN", observed=True, sort=False)["Status"]
+        .value_counts()
+        .unstack(fill_value=0)
+    )
+
+# ======================================
+# REPORT EXPORT (in memory, cached per result frame)
+# ======================================
+@st.cache_data(show_spinner=False, max_entries=8, ttl=CACHE_TTL)
+def to_excel_bytes(df: pd.DataFrame) -> bytes:
+    buf = io.BytesIO()
+    df.to_excel(buf, index=False, engine=EXCEL_ENGINE)
+    return buf.getvalue()
 
-            if tax_diff != 0:
-                status = "Mismatch"
-                remark = f"Tax Difference = {tax_diff}"
+# ======================================
+# FILE UPLOADS
+# ======================================
+purchase_file = st.file_uploader("Upload Purchase Register Excel", type=["xlsx"])
+b2b_file = st.file_uploader("Upload GSTR-2B Excel", type=["xlsx"])
 
-        results.append({
-            "GSTIN": row["GSTIN"],
-            "Invoice Number": row["Invoice_Number"],
-            "Invoice Date": row["Invoice_Date"],
-            "CGST": row["CGST"],
-            "SGST": row["SGST"],
-            "IGST": row["IGST"],
-            "Status": status,
-            "Remark": remark
-        })
+if purchase_file and b2b_file:
 
-    result_df = pd.DataFrame(results)
+    try:
+        result_df = reconcile(purchase_file.getvalue(), b2b_file.getvalue())
+    except ValueError as e:
+        st.error(f"❌ {e}")
+        st.stop()
 
     # ======================================
     # DASHBOARD
@@ -165,10 +362,12 @@ if purchase_file and b2b_file:
 
     c1, c2, c3, c4 = st.columns(4)
 
+    status_counts = result_df["Status"].value_counts()
+
     c1.metric("Total Invoices", len(result_df))
-    c2.metric("Matched", len(result_df[result_df["Status"] == "Matched"]))
-    c3.metric("Missing", len(result_df[result_df["Status"] == "Missing in 2B"]))
-    c4.metric("Mismatch", len(result_df[result_df["Status"] == "Mismatch"]))
+    c2.metric("Matched", int(status_counts.get("Matched", 0)))
+    c3.metric("Missing", int(status_counts.get("Missing in 2B", 0)))
+    c4.metric("Mismatch", int(status_counts.get("Mismatch", 0)))
 
     # ======================================
     # ⭐ STICKY STATUS CHART
@@ -176,7 +375,7 @@ if purchase_file and b2b_file:
     st.subheader("📉 Status Distribution")
 
     st.markdown('<div class="sticky-chart">', unsafe_allow_html=True)
-    st.bar_chart(result_df["Status"].value_counts(), use_container_width=True)
+    st.bar_chart(status_counts, use_container_width=True)
     st.markdown('</div>', unsafe_allow_html=True)
 
     # ======================================
@@ -184,14 +383,7 @@ if purchase_file and b2b_file:
     # ======================================
     st.subheader("📈 Vendor Summary")
 
-    vendor_summary = (
-        result_df.groupby("GSTIN")["Status"]
-        .value_counts()
-        .unstack()
-        .fillna(0)
-    )
-
-    st.dataframe(vendor_summary, use_container_width=True)
+    st.dataframe(vendor_summary(result_df), use_container_width=True)
 
     # ======================================
     # RESULT TABLE
@@ -203,7 +395,6 @@ if purchase_file and b2b_file:
     # DOWNLOAD REPORT
     # ======================================
     output_file = "PRO_GST_Reconciliation.xlsx"
-    result_df.to_excel(output_file, index=False)
-
-    with open(output_file, "rb") as f:
-        st.download_button("⬇ Download Report", f, file_name=output_file)
+    st.download_button(
+        "⬇ Download Report", to_excel_bytes(result_df), file_name=output_file
+    )
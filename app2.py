@@ -1,6 +1,30 @@
 import streamlit as st
 import pandas as pd
-import re
+import numpy as np
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+# The polars path needs fastexcel (calamine) and pyarrow (to_pandas) as well
+try:
+    import polars as pl
+    import fastexcel  # noqa: F401
+    import pyarrow  # noqa: F401
+except ImportError:
+    pl = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    STRING_DTYPE = "string[pyarrow]"
+except ImportError:
+    pa = None
+    STRING_DTYPE = "string"
+
+try:
+    import xlsxwriter  # noqa: F401
+    EXCEL_ENGINE = "xlsxwriter"
+except ImportError:
+    EXCEL_ENGINE = None  # pandas default (openpyxl)
 
 # ======================================
 # PAGE CONFIG
@@ -24,114 +48,310 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # ======================================
-# GSTIN VALIDATION
+# GSTIN VALIDATION PATTERN
 # ======================================
-def valid_gstin(gstin):
-    pattern = r'^[0-9]{2}[A-Z]{5}[0-9]{4}[A-Z]{1}[1-9A-Z]{1}Z[0-9A-Z]{1}$'
-    return bool(re.match(pattern, str(gstin)))
+# Matched column-wise via Series.str.match
+GSTIN_PATTERN = r'^[0-9]{2}[A-Z]{5}[0-9]{4}[A-Z]{1}[1-9A-Z]{1}Z[0-9A-Z]{1}$'
+
+# Fixed order for the Status category
+STATUSES = ["Matched", "Mismatch", "Missing in 2B", "Invalid GSTIN"]
+
+# st.cache_data is process-wide, so every cache is bounded and expires
+CACHE_TTL = "1h"
 
 # ======================================
-# FILE UPLOAD
+# EXCEL READER (polars + calamine, pandas fallback)
 # ======================================
-purchase_file = st.file_uploader("Upload Purchase Register", type=["xlsx"])
-b2b_file = st.file_uploader("Upload GSTR-2B", type=["xlsx"])
+RENAME_MAP = {
+    "Invoice Number":"Invoice_Number",
+    "Invoice No":"Invoice_Number",
+    "Invoice Date":"Invoice_Date",
+    "GSTIN":"GSTIN",
+    "CGST":"CGST",
+    "SGST":"SGST",
+    "IGST":"IGST"
+}
+
+# Only these headers are parsed, every other column is skipped
+SOURCE_COLUMNS = set(RENAME_MAP) | set(RENAME_MAP.values())
+
+def read_excel(file):
+    if pl is not None:
+        # Infer column types from every row: with the default 100-row sample
+        # a later value that doesn't fit (e.g. "INV-250" in a numeric invoice
+        # column) is silently read as null
+        return pl.read_excel(
+            file,
+            engine="calamine",
+            infer_schema_length=None,
+            read_options={"use_columns": lambda col: col.name.strip() in SOURCE_COLUMNS}
+        ).to_pandas(use_pyarrow_extension_array=True)
+    return pd.read_excel(file, usecols=lambda c: str(c).strip() in SOURCE_COLUMNS)
 
 # ======================================
-# MAIN ENGINE
+# INVOICE DATE PARSER (explicit formats before inference)
 # ======================================
-if purchase_file and b2b_file:
+DATE_FORMATS = ["%d-%m-%Y", "%Y-%m-%d"]
 
-    with st.spinner("⚡ Processing GST Data..."):
+def parse_invoice_date(s):
+    if isinstance(s.dtype, np.dtype) and s.dtype.kind == "M":
+        return s
+
+    # Arrow date/timestamp columns (real Excel date cells via calamine) are
+    # converted to NumPy datetime64 so later comparisons with Timestamp work
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return pd.to_datetime(s)
+
+    parsed = pd.to_datetime(s, format=DATE_FORMATS[0], errors="coerce", cache=True)
+
+    # Retry only the values the previous format could not read
+    for fmt in DATE_FORMATS[1:] + [None]:
+        todo = parsed.isna() & s.notna()
+        if not todo.any():
+            break
+        parsed[todo] = pd.to_datetime(s[todo], format=fmt, errors="coerce", cache=True)
+
+    return parsed
+
+# ======================================
+# MATCH KEY STRINGS
+# ======================================
+def to_key_strings(s):
+    # Whole-number floats (an invoice column with blanks) are keyed as
+    # integers so 123.0 and 123 match across files
+    # (checked on a NumPy view: Arrow-backed floats have no % operator)
+    if pd.api.types.is_float_dtype(s):
+        values = s.to_numpy(dtype="float64", na_value=np.nan)
+        if (np.isnan(values) | (values % 1 == 0)).all():
+            s = pd.Series(values, index=s.index).astype("Int64")
+
+    # Numbers are cast by pyarrow in C rather than one str() call per value
+    if pa is not None and pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s):
+        return pd.Series(
+            pd.arrays.ArrowStringArray(pc.cast(pa.array(s), pa.string())),
+            index=s.index
+        )
+
+    return s.astype(STRING_DTYPE)
 
-        # ---------- READ FILES ----------
-        purchase_df = pd.read_excel(purchase_file)
-        b2b_df = pd.read_excel(b2b_file)
-
-        purchase_df.columns = purchase_df.columns.str.strip()
-        b2b_df.columns = b2b_df.columns.str.strip()
-
-        # ---------- FLEXIBLE RENAME ----------
-        rename_map = {
-            "Invoice Number":"Invoice_Number",
-            "Invoice No":"Invoice_Number",
-            "Invoice Date":"Invoice_Date",
-            "GSTIN":"GSTIN",
-            "CGST":"CGST",
-            "SGST":"SGST",
-            "IGST":"IGST"
-        }
-
-        purchase_df = purchase_df.rename(columns=rename_map)
-        b2b_df = b2b_df.rename(columns=rename_map)
-
-        # ---------- VALIDATION ----------
-        required_cols = ["GSTIN","Invoice_Number","Invoice_Date","CGST","SGST","IGST"]
-
-        for col in required_cols:
-            if col not in purchase_df.columns:
-                st.error(f"❌ Missing column in Purchase File: {col}")
-                st.stop()
-            if col not in b2b_df.columns:
-                st.error(f"❌ Missing column in 2B File: {col}")
-                st.stop()
-
-        # ---------- DATE ----------
-        purchase_df["Invoice_Date"] = pd.to_datetime(purchase_df["Invoice_Date"], errors="coerce")
-        b2b_df["Invoice_Date"] = pd.to_datetime(b2b_df["Invoice_Date"], errors="coerce")
-
-        # ---------- CLEAN TAX ----------
-        for col in ["CGST","SGST","IGST"]:
-            purchase_df[col] = purchase_df[col].fillna(0)
-            b2b_df[col] = b2b_df[col].fillna(0)
-
-        # ---------- GSTIN VALID ----------
-        purchase_df["GSTIN_Valid"] = purchase_df["GSTIN"].apply(valid_gstin)
-
-        # ---------- UNIQUE KEY ----------
-        purchase_df["KEY"] = purchase_df["GSTIN"].astype(str) + "_" + purchase_df["Invoice_Number"].astype(str)
-        b2b_df["KEY"] = b2b_df["GSTIN"].astype(str) + "_" + b2b_df["Invoice_Number"].astype(str)
-
-        # ======================================
-        # ⭐ VECTORISED MATCH ENGINE (PRODUCTION)
-        # ======================================
-        merged_df = purchase_df.merge(
-            b2b_df[["KEY","CGST","SGST","IGST"]],
-            on="KEY",
-            how="left",
-            suffixes=("","_2B")
+# ======================================
+# MATCHING ENGINE
+# ======================================
+# Both engines return (tax_diff, code) aligned with purchase_df rows.
+# code indexes STATUSES: 3 Invalid GSTIN > 2 Missing in 2B > 1 Mismatch > 0 Matched
+# A key with a blank GSTIN or Invoice_Number never matches: such purchase
+# rows are "Missing in 2B", and such 2B rows are left out of the join (and
+# so out of the duplicate check).
+MATCH_KEYS = ["GSTIN", "Invoice_Number"]
+TAX_COLS = ["CGST", "SGST", "IGST"]
+
+def match_lazy(purchase_df, b2b_df):
+    # Join, tax difference and status code run as one optimised polars plan
+    # Tax amounts are compared as whole paise (Int64), not floats
+    to_paise = [(pl.col(c) * 100).round(0).cast(pl.Int64) for c in TAX_COLS]
+
+    lf_p = pl.from_pandas(purchase_df[MATCH_KEYS + TAX_COLS + ["GSTIN_Valid"]]).lazy()
+    lf_b = pl.from_pandas(b2b_df[MATCH_KEYS + TAX_COLS]).lazy()
+
+    lf_p = lf_p.with_columns(to_paise)
+    lf_b = lf_b.with_columns(to_paise).drop_nulls(MATCH_KEYS)
+
+    plan = (
+        lf_p.with_row_index("_row")
+        .join(lf_b, on=MATCH_KEYS, how="left", suffix="_2B", validate="m:1")
+        .with_columns(
+            Tax_Diff=pl.sum_horizontal(
+                [(pl.col(c) - pl.col(f"{c}_2B")).abs().fill_null(0) for c in TAX_COLS]
+            )
+        )
+        .with_columns(
+            code=pl.when(~pl.col("GSTIN_Valid")).then(3)
+            .when(pl.col("CGST_2B").is_null()).then(2)
+            .when(pl.col("Tax_Diff") != 0).then(1)
+            .otherwise(0)
+        )
+        .sort("_row")
+        .select(pl.col("Tax_Diff") / 100, "code")
+    )
+
+    try:
+        out = plan.collect()
+    except pl.exceptions.ComputeError as e:
+        # Only the m:1 join validation failure means duplicate 2B keys;
+        # any other compute error is a real failure and propagates
+        if "m:1" not in str(e):
+            raise
+        raise pd.errors.MergeError(str(e)) from e
+
+    return out["Tax_Diff"].to_numpy(), out["code"].to_numpy()
+
+def match_eager(purchase_df, b2b_df):
+    b2b_df = b2b_df.dropna(subset=MATCH_KEYS)
+
+    # Factorize the key columns over both sides into one int64 surrogate
+    # key, so the join hashes integers instead of string pairs. Blanks get
+    # their own code, but only purchase rows can still carry one, so a
+    # blank key never finds a 2B row
+    n = len(purchase_df)
+    key = np.zeros(n + len(b2b_df), dtype=np.int64)
+    for col in MATCH_KEYS:
+        codes, uniques = pd.factorize(
+            pd.concat([purchase_df[col], b2b_df[col]], ignore_index=True),
+            use_na_sentinel=False
         )
+        key = key * len(uniques) + codes
+
+    b2b_indexed = b2b_df[TAX_COLS].set_axis(key[n:])
+
+    merged_df = purchase_df[TAX_COLS + ["GSTIN_Valid"]].assign(_k=key[:n]).join(
+        b2b_indexed,
+        on="_k",
+        rsuffix="_2B",
+        validate="m:1"
+    )
+
+    valid = merged_df["GSTIN_Valid"].to_numpy(dtype=bool)
+    missing = merged_df["CGST_2B"].isna().to_numpy()
+
+    # One subtract / abs / row-sum over the 3 tax columns, in whole paise
+    # (int64) so the comparison is exact; missing 2B rows count as no difference
+    p = merged_df[TAX_COLS].to_numpy(dtype="float64", na_value=np.nan)
+    b = merged_df[[f"{c}_2B" for c in TAX_COLS]].to_numpy(dtype="float64", na_value=np.nan)
+    p = np.rint(p * 100).astype(np.int64)
+    b = np.rint(np.nan_to_num(b) * 100).astype(np.int64)
+
+    diff_paise = np.abs(p - b).sum(axis=1)
+    diff_paise[missing] = 0
+
+    code = np.where(~valid, 3, np.where(missing, 2, np.where(diff_paise != 0, 1, 0)))
+
+    return diff_paise / 100, code
+
+# ======================================
+# RECONCILIATION PIPELINE (cached on the uploaded bytes)
+# ======================================
+@st.cache_data(show_spinner=False, max_entries=8, ttl=CACHE_TTL)
+def reconcile(purchase_bytes: bytes, b2b_bytes: bytes) -> pd.DataFrame:
+    # ---------- READ FILES ----------
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        fut_p = ex.submit(read_excel, io.BytesIO(purchase_bytes))
+        fut_b = ex.submit(read_excel, io.BytesIO(b2b_bytes))
+        purchase_df, b2b_df = fut_p.result(), fut_b.result()
+
+    purchase_df.columns = purchase_df.columns.str.strip()
+    b2b_df.columns = b2b_df.columns.str.strip()
+
+    # ---------- FLEXIBLE RENAME ----------
+    purchase_df = purchase_df.rename(columns=RENAME_MAP)
+    b2b_df = b2b_df.rename(columns=RENAME_MAP)
+
+    # ---------- VALIDATION ----------
+    required_cols = ["GSTIN","Invoice_Number","Invoice_Date","CGST","SGST","IGST"]
+
+    for col in required_cols:
+        if col not in purchase_df.columns:
+            raise ValueError(f"Missing column in Purchase File: {col}")
+        if col not in b2b_df.columns:
+            raise ValueError(f"Missing column in 2B File: {col}")
+
+    # ---------- MATCH KEYS ----------
+    # Text copies used for matching only; the original columns are kept
+    # for display and export
+    purchase_keys = {col: to_key_strings(purchase_df[col]) for col in MATCH_KEYS}
+    b2b_keys = {col: to_key_strings(b2b_df[col]) for col in MATCH_KEYS}
+
+    # ---------- DATE ----------
+    purchase_df["Invoice_Date"] = parse_invoice_date(purchase_df["Invoice_Date"])
+    b2b_df["Invoice_Date"] = parse_invoice_date(b2b_df["Invoice_Date"])
+
+    # ---------- CLEAN TAX ----------
+    for df in (purchase_df, b2b_df):
+        df[TAX_COLS] = np.nan_to_num(
+            df[TAX_COLS].to_numpy(dtype="float64", na_value=np.nan), nan=0.0
+        )
+
+    # ---------- GSTIN VALID ----------
+    purchase_df["GSTIN_Valid"] = (
+        purchase_keys["GSTIN"].str.match(GSTIN_PATTERN, na=False)
+    )
 
-        # ======================================
-        # ⭐ PRIORITY STATUS ENGINE (FIXED)
-        # ======================================
-        merged_df["Status"] = "Matched"
-        merged_df["Remark"] = ""
-
-        # Tax Difference
-        merged_df["Tax_Diff"] = (
-            (merged_df["CGST"] - merged_df["CGST_2B"]).abs().fillna(0) +
-            (merged_df["SGST"] - merged_df["SGST_2B"]).abs().fillna(0) +
-            (merged_df["IGST"] - merged_df["IGST_2B"]).abs().fillna(0)
+    # ======================================
+    # ⭐ VECTORISED MATCH ENGINE (PRODUCTION)
+    # ======================================
+    match = match_lazy if pl is not None else match_eager
+
+    try:
+        tax_diff, code = match(
+            purchase_df.assign(**purchase_keys), b2b_df.assign(**b2b_keys)
         )
+    except pd.errors.MergeError:
+        raise ValueError("Duplicate GSTIN + Invoice Number rows found in 2B File") from None
+
+    # ======================================
+    # ⭐ PRIORITY STATUS ENGINE (FIXED)
+    # ======================================
+    purchase_df["Status"] = pd.Categorical.from_codes(code, categories=STATUSES)
+    purchase_df["Remark"] = np.take(
+        np.array(["", "Tax Difference", "Invoice not in 2B", ""], dtype=object), code
+    )
+
+    # FINAL RESULT
+    result_df = purchase_df[[
+        "GSTIN","Invoice_Number","Invoice_Date",
+        "CGST","SGST","IGST","Status","Remark"
+    ]].copy()
+
+    result_df["GSTIN"] = result_df["GSTIN"].astype("category")
+
+    return result_df
+
+# ======================================
+# VENDOR SUMMARY (cached per result frame)
+# ======================================
+@st.cache_data(show_spinner=False, max_entries=32, ttl=CACHE_TTL)
+def vendor_summary(df: pd.DataFrame) -> pd.DataFrame:
+    return (
+        df.groupby("GSTIN", observed=True, sort=False)["Status"]
+        .value_counts()
+        .unstack(fill_value=0)
+    )
+
+# ======================================
+# REPORT EXPORT (in memory, cached per result frame)
+# ======================================
+@st.cache_data(show_spinner=False, max_entries=8, ttl=CACHE_TTL)
+def to_excel_bytes(df: pd.DataFrame) -> bytes:
+    buf = io.BytesIO()
+    df.to_excel(buf, index=False, engine=EXCEL_ENGINE)
+    return buf.getvalue()
 
-        # 1️⃣ Invalid GSTIN
-        merged_df.loc[~merged_df["GSTIN_Valid"], "Status"] = "Invalid GSTIN"
+# ======================================
+# CATEGORY FILTER MASK
+# ======================================
+def category_mask(col, selected):
+    # Lookup table indexed by category code; the extra last slot maps
+    # missing values (code -1) to False
+    allowed = np.append(col.cat.categories.isin(selected), False)
+    return allowed[col.cat.codes.to_numpy()]
 
-        # 2️⃣ Missing in 2B
-        missing_mask = merged_df["CGST_2B"].isna()
-        merged_df.loc[missing_mask & merged_df["GSTIN_Valid"], "Status"] = "Missing in 2B"
-        merged_df.loc[missing_mask & merged_df["GSTIN_Valid"], "Remark"] = "Invoice not in 2B"
+# ======================================
+# FILE UPLOAD
+# ======================================
+purchase_file = st.file_uploader("Upload Purchase Register", type=["xlsx"])
+b2b_file = st.file_uploader("Upload GSTR-2B", type=["xlsx"])
 
-        # 3️⃣ Mismatch
-        mismatch_mask = (merged_df["Tax_Diff"] != 0) & (~missing_mask)
-        merged_df.loc[mismatch_mask & merged_df["GSTIN_Valid"], "Status"] = "Mismatch"
-        merged_df.loc[mismatch_mask & merged_df["GSTIN_Valid"], "Remark"] = "Tax Difference"
+# ======================================
+# MAIN ENGINE
+# ======================================
+if purchase_file and b2b_file:
+
+    with st.spinner("⚡ Processing GST Data..."):
 
-        # FINAL RESULT
-        result_df = merged_df[[
-            "GSTIN","Invoice_Number","Invoice_Date",
-            "CGST","SGST","IGST","Status","Remark"
-        ]]
+        try:
+            result_df = reconcile(purchase_file.getvalue(), b2b_file.getvalue())
+        except ValueError as e:
+            st.error(f"❌ {e}")
+            st.stop()
 
     # ======================================
     # ⭐ SAAS SIDEBAR FILTERS
@@ -140,29 +360,32 @@ if purchase_file and b2b_file:
 
     vendor_filter = st.sidebar.multiselect(
         "Select Vendor GSTIN",
-        sorted(result_df["GSTIN"].unique())
+        list(result_df["GSTIN"].cat.categories)
     )
 
     status_filter = st.sidebar.multiselect(
         "Status",
-        ["Matched","Mismatch","Missing in 2B","Invalid GSTIN"]
+        STATUSES
     )
 
     date_range = st.sidebar.date_input("Invoice Date Range", [])
 
-    filtered_df = result_df.copy()
+    mask = np.ones(len(result_df), dtype=bool)
 
     if vendor_filter:
-        filtered_df = filtered_df[filtered_df["GSTIN"].isin(vendor_filter)]
+        mask &= category_mask(result_df["GSTIN"], vendor_filter)
 
     if status_filter:
-        filtered_df = filtered_df[filtered_df["Status"].isin(status_filter)]
+        mask &= category_mask(result_df["Status"], status_filter)
 
     if len(date_range) == 2:
-        filtered_df = filtered_df[
-            (filtered_df["Invoice_Date"] >= pd.to_datetime(date_range[0])) &
-            (filtered_df["Invoice_Date"] <= pd.to_datetime(date_range[1]))
-        ]
+        dates = result_df["Invoice_Date"]
+        mask &= (
+            (dates >= pd.to_datetime(date_range[0])) &
+            (dates <= pd.to_datetime(date_range[1]))
+        ).to_numpy(dtype=bool, na_value=False)
+
+    filtered_df = result_df[mask]
 
     # ======================================
     # KPI CARDS
@@ -171,10 +394,12 @@ if purchase_file and b2b_file:
 
     c1,c2,c3,c4 = st.columns(4)
 
+    status_counts = filtered_df["Status"].value_counts()
+
     c1.metric("Total",len(filtered_df))
-    c2.metric("Matched",len(filtered_df[filtered_df["Status"]=="Matched"]))
-    c3.metric("Missing",len(filtered_df[filtered_df["Status"]=="Missing in 2B"]))
-    c4.metric("Mismatch",len(filtered_df[filtered_df["Status"]=="Mismatch"]))
+    c2.metric("Matched",int(status_counts.get("Matched",0)))
+    c3.metric("Missing",int(status_counts.get("Missing in 2B",0)))
+    c4.metric("Mismatch",int(status_counts.get("Mismatch",0)))
 
     # ======================================
     # STICKY CHART
@@ -182,7 +407,7 @@ if purchase_file and b2b_file:
     st.subheader("📉 Status Distribution")
 
     st.markdown('<div class="sticky-chart">', unsafe_allow_html=True)
-    st.bar_chart(filtered_df["Status"].value_counts(), use_container_width=True)
+    st.bar_chart(status_counts, use_container_width=True)
     st.markdown('</div>', unsafe_allow_html=True)
 
     # ======================================
@@ -190,14 +415,7 @@ if purchase_file and b2b_file:
     # ======================================
     st.subheader("📈 Vendor Summary")
 
-    vendor_summary = (
-        filtered_df.groupby("GSTIN")["Status"]
-        .value_counts()
-        .unstack()
-        .fillna(0)
-    )
-
-    st.dataframe(vendor_summary,use_container_width=True)
+    st.dataframe(vendor_summary(filtered_df),use_container_width=True)
 
     # ======================================
     # TABLE
@@ -209,7 +427,4 @@ if purchase_file and b2b_file:
     # DOWNLOAD REPORT
     # ======================================
     output_file="GST_SaaS_Report.xlsx"
-    filtered_df.to_excel(output_file,index=False)
-
-    with open(output_file,"rb") as f:
-        st.download_button("⬇ Download Filtered Report",f,file_name=output_file)
+    st.download_button("⬇ Download Filtered Report",to_excel_bytes(filtered_df),file_name=output_file)